@@ -1,31 +1,127 @@
+import hashlib
 import os
-from typing import Optional, List
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional, List, Tuple
 
-from fastapi import FastAPI, Body, HTTPException, status
-from fastapi.responses import Response
+from fastapi import FastAPI, Body, HTTPException, Request, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import ConfigDict, BaseModel, Field, EmailStr
-from pydantic.functional_validators import BeforeValidator
+from pydantic.functional_validators import BeforeValidator, PlainValidator
+from pydantic.json_schema import WithJsonSchema
 
 from typing_extensions import Annotated
 
+import bson
 from bson import ObjectId
+from bson.errors import InvalidId
 import motor.motor_asyncio
 from pymongo import ReturnDocument
+import orjson
+
+
+# The client is shared by every request, and maintains a pool of connections to the database.
+# The pool is configured with options in the connection string - see the README.
+client = motor.motor_asyncio.AsyncIOMotorClient(os.environ["MONGODB_URL"])
+db = client.college
+student_collection = db.get_collection("students")
+
+# Only fetch the fields that are part of the student model, so every response has the same shape.
+STUDENT_PROJECTION = {"name": 1, "email": 1, "course": 1, "gpa": 1}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Connect to the database before the app starts serving requests.
+    """
+    # Motor connects lazily, so without this the first request would wait for
+    # server selection and the connection handshake.
+    await client.admin.command("ping")
+    yield
+    client.close()
 
 
 app = FastAPI(
     title="Student Course API",
     summary="A sample application showing how to use FastAPI to add a ReST API to a MongoDB collection.",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
-client = motor.motor_asyncio.AsyncIOMotorClient(os.environ["MONGODB_URL"])
-db = client.college
-student_collection = db.get_collection("students")
+# Compress larger responses, such as the student list, if the client supports it.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# How long, in seconds, a cached response from `list_students` can be served for.
+STUDENT_LIST_CACHE_TTL = 30
+
+# The time the last `list_students` response was created, its serialized body, and its ETag.
+# Handlers that modify the students collection must call `clear_student_list_cache`.
+_student_list_cache: Optional[Tuple[float, bytes, str]] = None
+
+# Incremented whenever the cache is cleared, so a response that was being
+# loaded while the data was modified isn't stored in the cache.
+_student_list_cache_generation = 0
+
+
+def clear_student_list_cache():
+    """
+    Discard the cached `list_students` response, so the next request reloads it from the database.
+    """
+    global _student_list_cache, _student_list_cache_generation
+    _student_list_cache = None
+    _student_list_cache_generation += 1
+
+
+def make_etag(data: bytes) -> str:
+    """
+    Create a weak ETag header value from some serialized data.
+    """
+    return f'W/"{hashlib.blake2b(data, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already has the version of a resource identified by `etag`.
+
+    An `If-None-Match` value of `*` matches any version of a resource that exists.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
 
 # Represents an ObjectId field in the database.
 # It will be represented as a `str` on the model so that it can be serialized to JSON.
 PyObjectId = Annotated[str, BeforeValidator(str)]
 
 
+def parse_object_id(value: Any) -> ObjectId:
+    """
+    Convert a string to an ObjectId, raising `ValueError` if it isn't valid.
+    """
+    if isinstance(value, ObjectId):
+        return value
+    # Other types must be rejected explicitly: `ObjectId(None)`, for example, creates a new id.
+    if not isinstance(value, str):
+        raise ValueError(f"{value!r} is not a valid ObjectId, it must be a string")
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError) as e:
+        raise ValueError(str(e)) from e
+
+
+# Represents an ObjectId provided in a request, such as a path parameter or a request body.
+# It is parsed before the handler is called, and invalid values result in a 422 response.
+ObjectIdInput = Annotated[
+    ObjectId,
+    PlainValidator(parse_object_id),
+    WithJsonSchema({"type": "string"}),
+]
+
+
 class StudentModel(BaseModel):
     """
     Container for a single student record.
@@ -76,6 +172,17 @@ class UpdateStudentModel(BaseModel):
     )
 
 
+def student_to_json(student: dict) -> dict:
+    """
+    Convert a student document from MongoDB into the form provided in API responses.
+
+    Documents were validated when they were written to the database,
+    so this skips the cost of validating them against `StudentModel` again.
+    """
+    student["id"] = str(student.pop("_id"))
+    return student
+
+
 class StudentCollection(BaseModel):
     """
     A container holding a list of `StudentModel` instances.
@@ -99,13 +206,14 @@ async def create_student(student: StudentModel = Body(...)):
 
     A unique `id` will be created and provided in the response.
     """
-    new_student = await student_collection.insert_one(
-        student.model_dump(by_alias=True, exclude=["id"])
-    )
-    created_student = await student_collection.find_one(
-        {"_id": new_student.inserted_id}
+    new_student = student.model_dump(by_alias=True, exclude=["id"])
+    insert_result = await student_collection.insert_one(new_student)
+    # The stored document is exactly what was sent, so there's no need to fetch it back:
+    new_student["_id"] = insert_result.inserted_id
+    clear_student_list_cache()
+    return ORJSONResponse(
+        student_to_json(new_student), status_code=status.HTTP_201_CREATED
     )
-    return created_student
 
 
 @app.get(
@@ -114,13 +222,38 @@ async def create_student(student: StudentModel = Body(...)):
     response_model=StudentCollection,
     response_model_by_alias=False,
 )
-async def list_students():
+async def list_students(request: Request):
     """
     List all of the student data in the database.
 
     The response is unpaginated and limited to 1000 results.
+    It is cached for `STUDENT_LIST_CACHE_TTL` seconds, or until the data is modified.
+    A `304 Not Modified` response is sent if the `If-None-Match` header matches the current ETag.
     """
-    return StudentCollection(students=await student_collection.find().to_list(1000))
+    global _student_list_cache
+    cached = _student_list_cache
+    if cached is None or time.monotonic() - cached[0] > STUDENT_LIST_CACHE_TTL:
+        generation = _student_list_cache_generation
+        # Serialize each document as it's read from the cursor,
+        # rather than loading the whole result set into memory first.
+        students = []
+        cursor = (
+            student_collection.find({}, STUDENT_PROJECTION).limit(1000).batch_size(100)
+        )
+        async for student in cursor:
+            students.append(orjson.dumps(student_to_json(student)))
+        body = b'{"students":[' + b",".join(students) + b"]}"
+        cached = (time.monotonic(), body, make_etag(body))
+        # Don't cache the response if the data was modified while it was loading:
+        if generation == _student_list_cache_generation:
+            _student_list_cache = cached
+
+    _, body, etag = cached
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @app.get(
@@ -129,61 +262,113 @@ async def list_students():
     response_model=StudentModel,
     response_model_by_alias=False,
 )
-async def show_student(id: str):
+async def show_student(id: ObjectIdInput, request: Request):
     """
     Get the record for a specific student, looked up by `id`.
+
+    A `304 Not Modified` response is sent if the `If-None-Match` header matches the current ETag.
     """
     if (
-        student := await student_collection.find_one({"_id": ObjectId(id)})
+        student := await student_collection.find_one(
+            {"_id": id}, projection=STUDENT_PROJECTION
+        )
     ) is not None:
-        return student
+        # The ETag is calculated from the stored document, so it changes whenever the document does.
+        etag = make_etag(bson.encode(student))
+        if etag_matches(request, etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+            )
+        return ORJSONResponse(student_to_json(student), headers={"ETag": etag})
 
     raise HTTPException(status_code=404, detail=f"Student {id} not found")
 
 
+@app.post(
+    "/students:batch",
+    response_description="Get multiple students",
+    response_model=StudentCollection,
+    response_model_by_alias=False,
+)
+async def show_students(ids: List[ObjectIdInput] = Body(..., max_length=1000)):
+    """
+    Get the records for several students at once, looked up by a list of `id`s.
+
+    Students are returned in the order they were first requested, and each is only returned once.
+    Any `id`s that don't match a student are left out of the response.
+    """
+    students_by_id = {
+        student["_id"]: student
+        async for student in student_collection.find(
+            {"_id": {"$in": ids}}, STUDENT_PROJECTION
+        )
+    }
+    return ORJSONResponse(
+        {
+            "students": [
+                student_to_json(students_by_id.pop(id))
+                for id in ids
+                if id in students_by_id
+            ]
+        }
+    )
+
+
 @app.put(
     "/students/{id}",
     response_description="Update a student",
     response_model=StudentModel,
     response_model_by_alias=False,
 )
-async def update_student(id: str, student: UpdateStudentModel = Body(...)):
+async def update_student(id: ObjectIdInput, student: UpdateStudentModel = Body(...)):
     """
     Update individual fields of an existing student record.
 
     Only the provided fields will be updated.
     Any missing or `null` fields will be ignored.
     """
-    student = {
-        k: v for k, v in student.model_dump(by_alias=True).items() if v is not None
-    }
+    student = student.model_dump(by_alias=True, exclude_none=True)
 
     if len(student) >= 1:
         update_result = await student_collection.find_one_and_update(
-            {"_id": ObjectId(id)},
+            {"_id": id},
             {"$set": student},
+            projection=STUDENT_PROJECTION,
             return_document=ReturnDocument.AFTER,
         )
         if update_result is not None:
-            return update_result
+            clear_student_list_cache()
+            return ORJSONResponse(student_to_json(update_result))
         else:
             raise HTTPException(status_code=404, detail=f"Student {id} not found")
 
     # The update is empty, but we should still return the matching document:
-    if (existing_student := await student_collection.find_one({"_id": id})) is not None:
-        return existing_student
+    if (
+        existing_student := await student_collection.find_one(
+            {"_id": id}, projection=STUDENT_PROJECTION
+        )
+    ) is not None:
+        return ORJSONResponse(student_to_json(existing_student))
 
     raise HTTPException(status_code=404, detail=f"Student {id} not found")
 
 
-@app.delete("/students/{id}", response_description="Delete a student")
-async def delete_student(id: str):
+@app.delete(
+    "/students/{id}",
+    response_description="Delete a student",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+)
+async def delete_student(id: ObjectIdInput):
     """
     Remove a single student record from the database.
     """
-    delete_result = await student_collection.delete_one({"_id": ObjectId(id)})
+    deleted_student = await student_collection.find_one_and_delete(
+        {"_id": id}, projection={"_id": 1}
+    )
 
-    if delete_result.deleted_count == 1:
+    if deleted_student is not None:
+        clear_student_list_cache()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     raise HTTPException(status_code=404, detail=f"Student {id} not found")
@@ -1,4 +1,4 @@
-from requests import get, post, put, delete, HTTPError
+from requests import HTTPError, Session
 
 
 def test_api():
@@ -7,6 +7,8 @@ def test_api():
     testing the lifecycle of an inserted document.
     """
     student_root = "http://localhost:8000/students/"
+    student_batch = "http://localhost:8000/students:batch"
+    missing_id = "000000000000000000000000"
 
     initial_doc = {
         "course": "Test Course",
@@ -15,69 +17,101 @@ def test_api():
         "name": "Jane Doe",
     }
 
-    try:
-        # Insert a student
-        response = post(student_root, json=initial_doc)
-        response.raise_for_status()
-        doc = response.json()
-        inserted_id = doc["id"]
-        print(f"Inserted document with id: {inserted_id}")
-        print(
-            "If the test fails in the middle you may want to manually remove the document."
-        )
-        assert doc["course"] == "Test Course"
-        assert doc["email"] == "jdoe_test@example.com"
-        assert doc["gpa"] == 3.0
-        assert doc["name"] == "Jane Doe"
+    # A single session reuses the same connection for every request.
+    with Session() as session:
+        try:
+            # Insert a student
+            response = session.post(student_root, json=initial_doc)
+            response.raise_for_status()
+            doc = response.json()
+            inserted_id = doc["id"]
+            print(f"Inserted document with id: {inserted_id}")
+            print(
+                "If the test fails in the middle you may want to manually remove the document."
+            )
+            assert doc["course"] == "Test Course"
+            assert doc["email"] == "jdoe_test@example.com"
+            assert doc["gpa"] == 3.0
+            assert doc["name"] == "Jane Doe"
 
-        # List students and ensure it's present
-        response = get(student_root)
-        response.raise_for_status()
-        student_ids = {s["id"] for s in response.json()["students"]}
-        assert inserted_id in student_ids
+            # List students and ensure it's present
+            response = session.get(student_root)
+            response.raise_for_status()
+            student_ids = {s["id"] for s in response.json()["students"]}
+            assert inserted_id in student_ids
 
-        # Get individual student doc
-        response = get(student_root + inserted_id)
-        response.raise_for_status()
-        doc = response.json()
-        assert doc["id"] == inserted_id
-        assert doc["course"] == "Test Course"
-        assert doc["email"] == "jdoe_test@example.com"
-        assert doc["gpa"] == 3.0
-        assert doc["name"] == "Jane Doe"
+            # Get students in a batch, ensuring duplicate and missing ids are left out
+            response = session.post(
+                student_batch, json=[inserted_id, inserted_id, missing_id]
+            )
+            response.raise_for_status()
+            student_ids = [s["id"] for s in response.json()["students"]]
+            assert student_ids == [inserted_id]
 
-        # Update the student doc
-        response = put(
-            student_root + inserted_id,
-            json={
-                "email": "updated_email@example.com",
-            },
-        )
-        response.raise_for_status()
-        doc = response.json()
-        assert doc["id"] == inserted_id
-        assert doc["course"] == "Test Course"
-        assert doc["email"] == "updated_email@example.com"
-        assert doc["gpa"] == 3.0
-        assert doc["name"] == "Jane Doe"
+            # Ensure an invalid id in a batch is rejected
+            response = session.post(student_batch, json=[inserted_id, 1])
+            assert response.status_code == 422
 
-        # Get the student doc and check for change
-        response = get(student_root + inserted_id)
-        response.raise_for_status()
-        doc = response.json()
-        assert doc["id"] == inserted_id
-        assert doc["course"] == "Test Course"
-        assert doc["email"] == "updated_email@example.com"
-        assert doc["gpa"] == 3.0
-        assert doc["name"] == "Jane Doe"
+            # Get individual student doc
+            response = session.get(student_root + inserted_id)
+            response.raise_for_status()
+            doc = response.json()
+            assert doc["id"] == inserted_id
+            assert doc["course"] == "Test Course"
+            assert doc["email"] == "jdoe_test@example.com"
+            assert doc["gpa"] == 3.0
+            assert doc["name"] == "Jane Doe"
 
-        # Delete the doc
-        response = delete(student_root + inserted_id)
-        response.raise_for_status()
+            # Get the student doc again, with the ETag, and ensure it hasn't been modified
+            etag = response.headers["ETag"]
+            response = session.get(
+                student_root + inserted_id, headers={"If-None-Match": etag}
+            )
+            assert response.status_code == 304
+            assert response.headers["ETag"] == etag
 
-        # Get the doc and ensure it's been deleted
-        response = get(student_root + inserted_id)
-        assert response.status_code == 404
-    except HTTPError as he:
-        print(he.response.json())
-        raise
+            # Update the student doc
+            response = session.put(
+                student_root + inserted_id,
+                json={
+                    "email": "updated_email@example.com",
+                },
+            )
+            response.raise_for_status()
+            doc = response.json()
+            assert doc["id"] == inserted_id
+            assert doc["course"] == "Test Course"
+            assert doc["email"] == "updated_email@example.com"
+            assert doc["gpa"] == 3.0
+            assert doc["name"] == "Jane Doe"
+
+            # Get the student doc and check for change
+            response = session.get(student_root + inserted_id)
+            response.raise_for_status()
+            doc = response.json()
+            assert doc["id"] == inserted_id
+            assert doc["course"] == "Test Course"
+            assert doc["email"] == "updated_email@example.com"
+            assert doc["gpa"] == 3.0
+            assert doc["name"] == "Jane Doe"
+
+            # Send an empty update and ensure the doc is returned unchanged
+            response = session.put(student_root + inserted_id, json={})
+            assert response.status_code == 200
+            doc = response.json()
+            assert doc["id"] == inserted_id
+            assert doc["course"] == "Test Course"
+            assert doc["email"] == "updated_email@example.com"
+            assert doc["gpa"] == 3.0
+            assert doc["name"] == "Jane Doe"
+
+            # Delete the doc
+            response = session.delete(student_root + inserted_id)
+            response.raise_for_status()
+
+            # Get the doc and ensure it's been deleted
+            response = session.get(student_root + inserted_id)
+            assert response.status_code == 404
+        except HTTPError as he:
+            print(he.response.json())
+            raise